@@ -22,6 +22,9 @@ def index_policy_from_string(s: str) -> int:
         return Vector_Index_Policy
 
 
+_Vector_Index_Block = struct.Struct("<II")
+
+
 class VectorIndexBlock:
     first_ptr = 0
     last_ptr = 0
@@ -34,10 +37,11 @@ class VectorIndexBlock:
         return "FirstPtr: {}, LastPrt: {}".format(self.first_ptr, self.last_ptr)
 
     def encode(self) -> bytes:
-        return struct.pack("<II", self.first_ptr, self.last_ptr)
+        return _Vector_Index_Block.pack(self.first_ptr, self.last_ptr)
 
 
 Segment_Index_Block_Size = 14
+_Segment_Index_Block = struct.Struct("<IIHI")
 
 
 class SegmentIndexBlock:
@@ -58,6 +62,6 @@ class SegmentIndexBlock:
         )
 
     def encode(self) -> bytes:
-        return struct.pack(
-            "<IIHI", self.start_ip, self.end_ip, self.data_len, self.data_ptr
+        return _Segment_Index_Block.pack(
+            self.start_ip, self.end_ip, self.data_len, self.data_ptr
         )
@@ -49,7 +49,10 @@
 # | 4bytes	   | 4bytes	   | 2bytes		   | 4 bytes    |
 # +------------+-----------+---------------+------------+
 #  start ip 	  end ip	  data length     data ptr
+import array
 import logging
+import mmap
+import os
 import struct
 import time
 import sys
@@ -66,6 +69,17 @@ Vector_Index_Cols = 256
 Vector_Index_Size = 8
 Vector_Index_Length = Vector_Index_Rows * Vector_Index_Cols * Vector_Index_Size
 
+# Pre-compiled header layout: version, index policy, created time,
+# index block start ptr and index block end ptr
+_HDR = struct.Struct("<HHIII")
+# Pre-compiled layout of the index block (start ptr, end ptr) in the header
+_PTR = struct.Struct("<II")
+# Pre-compiled segment index entry layout, see `idx.SegmentIndexBlock`
+_SEG_IDX = struct.Struct("<IIHI")
+# Pre-two bytes only view of a segment index entry: the high 16 bits of the
+# little-endian start ip, that is the vector index block `row * 256 + col`
+_SEG_IDX_VI = struct.Struct("<2xH{}x".format(idx.Segment_Index_Block_Size - 4))
+
 
 class Maker:
     src_handle = None
@@ -100,17 +114,12 @@ class Maker:
         self.src_handle.seek(0, 0)
 
         # Make and write the header space
-        header = bytearray([0] * 256)
-        # 1. Version number
-        header[0:2] = Version_No.to_bytes(2, byteorder="little")
-        # 2. Index policy code
-        header[2:4] = int(self.index_policy).to_bytes(2, byteorder="little")
-        # 3. Generate unix timestamp
-        header[4:8] = int(time.time()).to_bytes(4, byteorder="little")
-        # 4. Index block start ptr
-        header[8:12] = int(0).to_bytes(4, byteorder="little")
-        # 5. Index block end ptr
-        header[12:16] = int(0).to_bytes(4, byteorder="little")
+        header = bytearray(Header_Info_Length)
+        # Version number, index policy code, generate unix timestamp,
+        # index block start ptr and index block end ptr
+        _HDR.pack_into(
+            header, 0, Version_No, int(self.index_policy), int(time.time()), 0, 0
+        )
         # Write header buffer to file
         self.dst_handle.write(header)
 
@@ -123,9 +132,12 @@ class Maker:
         last = None
         s_tm = time.time()
 
+        # Read and decode the whole source file at once
+        log_debug = logging.getLogger().isEnabledFor(logging.DEBUG)
         lines = self.src_handle.read().splitlines()
         for line in lines:
-            logging.info("load segment: `{}`".format(line))
+            if log_debug:
+                logging.debug("load segment: `%s`", line)
             ps = line.split("|", maxsplit=2)
             if len(ps) != 3:
                 logging.error("invalid ip segment line `{}`".format(line))
@@ -159,7 +171,7 @@ class Maker:
                 if last.end_ip + 1 != segment.start_ip:
                     logging.error(
                         "discontinuous data segment: last.eip+1({})!=seg.sip({}, {})".format(
-                            sip, eip, ps[0]
+                            last.end_ip + 1, sip, ps[0]
                         )
                     )
                     return []
@@ -171,18 +183,23 @@ class Maker:
             )
         )
 
-    def set_vector_index(self, ip, ptr):
+    def fill_vector_index(self, idx_buf, idx_base):
         """
-        Init and refresh the vector index based on the IP pre-two bytes.
+        Init the vector index from the whole encoded segment index block
+        in one pass, `idx_base` is the file ptr of the first index entry.
         """
-        row, col = (ip >> 24) & 0xFF, (ip >> 16) & 0xFF
-        vi_block = self.vector_index[row][col]
-        if vi_block.first_ptr == 0:
-            vi_block.first_ptr = ptr
-            vi_block.last_ptr = ptr + idx.Segment_Index_Block_Size
-        else:
-            vi_block.last_ptr = ptr + idx.Segment_Index_Block_Size
-        self.vector_index[row][col] = vi_block
+        # The index entries are sorted by ip, so the entries of a vector index
+        # block are contiguous and its first ptr is set when the block number
+        # changes, instead of testing the stored first ptr against 0.
+        vi = self.vector_index
+        ptr, last_block = idx_base, -1
+        for (block,) in _SEG_IDX_VI.iter_unpack(idx_buf):
+            i = block << 1
+            if block != last_block:
+                vi[i] = ptr
+                last_block = block
+            ptr += idx.Segment_Index_Block_Size
+            vi[i + 1] = ptr
 
     def start(self):
         """
@@ -192,81 +209,109 @@ class Maker:
             logging.error("empty segment list")
             return
 
-        # 1. Write all the region/data to the binary file
-        self.dst_handle.seek(Header_Info_Length + Vector_Index_Length, 0)
+        # 1. Build the data block and the segment index block in one pass
+        # Both blocks are buffered in memory: the region ptr is derived from
+        # the data buffer offset and the index entries are packed as soon as
+        # the region of their segment is cached.
+        data_base = Header_Info_Length + Vector_Index_Length
+        data_buf = bytearray()
+        total_splits = sum(
+            seg.split_count(sg.start_ip, sg.end_ip) for sg in self.segments
+        )
+        idx_buf = bytearray(total_splits * idx.Segment_Index_Block_Size)
+        counter = 0
 
-        logging.info("try to write the data block ... ")
-        for s in self.segments:
-            logging.info("try to write region '{}'...".format(s.region))
-            if s.region in self.region_pool:
-                logging.info(
-                    " --[Cached] with ptr={}".format(self.region_pool[s.region])
-                )
-                continue
-            region = bytes(s.region, encoding="utf-8")
-            if len(region) > 0xFFFF:
-                logging.error(
-                    "too long region info `{}`: should be less than {} bytes".format(
-                        s.region, 0xFFFF
-                    )
-                )
-                return
-            # Get the first ptr of the next region
-            pos = self.dst_handle.seek(0, 1)
-            logging.info("{} {} {}".format(pos, region, s.region))
-            self.dst_handle.write(region)
-            self.region_pool[s.region] = pos
-            logging.info(" --[Added] with ptr={}".format(pos))
-        # 2. Write the index block and cache the super index block
-        logging.info("try to write the segment index block ... ")
-        counter, start_index_ptr, end_index_ptr = 0, -1, -1
-        for sg in self.segments:
-            if sg.region not in self.region_pool:
-                logging.error("missing ptr cache for region `{}`".format(sg.region))
-                return
-            data_len = len(bytes(sg.region, encoding="utf-8"))
-            if data_len < 1:
-                logging.error("empty region info for segment '{}'".format(sg.region))
-                return
+        # Per-entry logs are only emitted at DEBUG level, check it once here
+        # to keep the formatting and logging machinery out of the hot loops.
+        log_debug = logging.getLogger().isEnabledFor(logging.DEBUG)
 
-            seg_list = sg.split()
-            logging.info(
-                "try to index segment({} split) {} ...".format(len(seg_list), sg)
-            )
-            for s in seg_list:
-                pos = self.dst_handle.seek(0, 1)
+        logging.info("try to build the data and segment index block ... ")
+        for sg in self.segments:
+            if sg.region in self.region_pool:
+                data_ptr, data_len = self.region_pool[sg.region]
+                if log_debug:
+                    logging.debug(
+                        "region '%s' --[Cached] with ptr=%d", sg.region, data_ptr
+                    )
+            else:
+                region = bytes(sg.region, encoding="utf-8")
+                data_ptr, data_len = data_base + len(data_buf), len(region)
+                if data_len < 1:
+                    logging.error(
+                        "empty region info for segment '{}'".format(sg.region)
+                    )
+                    return
+                if data_len > 0xFFFF:
+                    logging.error(
+                        "too long region info `{}`: should be less than {} bytes".format(
+                            sg.region, 0xFFFF
+                        )
+                    )
+                    return
+                data_buf.extend(region)
+                # Cache the ptr and the encoded length for the next segments
+                self.region_pool[sg.region] = (data_ptr, data_len)
+                if log_debug:
+                    logging.debug(
+                        "region '%s' --[Added] with ptr=%d", sg.region, data_ptr
+                    )
 
-                s_index = idx.SegmentIndexBlock(
-                    sip=s.start_ip,
-                    eip=s.end_ip,
-                    dl=data_len,
-                    dp=self.region_pool[sg.region],
+            if log_debug:
+                logging.debug(
+                    "try to index segment(%d split) %s ...",
+                    seg.split_count(sg.start_ip, sg.end_ip),
+                    sg,
                 )
-                self.dst_handle.write(s_index.encode())
-                logging.info(
-                    "|-segment index: {}, ptr: {}, segment: {}".format(counter, pos, s)
+            for sip, eip in sg.split():
+                _SEG_IDX.pack_into(
+                    idx_buf,
+                    counter * idx.Segment_Index_Block_Size,
+                    sip,
+                    eip,
+                    data_len,
+                    data_ptr,
                 )
-                self.set_vector_index(s.start_ip, pos)
+                if log_debug:
+                    logging.debug(
+                        "|-segment index: %d, segment: %s|%s",
+                        counter,
+                        util.long2ip(sip),
+                        util.long2ip(eip),
+                    )
                 counter += 1
 
-                # Check and record the start index ptr
-                if start_index_ptr == -1:
-                    start_index_ptr = pos
-                end_index_ptr = pos
+        # Record the start and end index ptr
+        # The index block follows the data block in the file
+        idx_base = data_base + len(data_buf)
+        start_index_ptr = idx_base
+        end_index_ptr = idx_base + (counter - 1) * idx.Segment_Index_Block_Size
+        self.fill_vector_index(idx_buf, idx_base)
+
+        # 2. Write all the blocks to the binary file
+        # The final file size is known from here on: grow the file once and
+        # store all the blocks through a memory map.
+        file_size = idx_base + len(idx_buf)
+        self.dst_handle.flush()
+        os.ftruncate(self.dst_handle.fileno(), file_size)
+        with mmap.mmap(
+            self.dst_handle.fileno(), file_size, access=mmap.ACCESS_WRITE
+        ) as mm:
+            logging.info("try to write the data and segment index block ... ")
+            mm[data_base:idx_base] = data_buf
+            mm[idx_base:file_size] = idx_buf
 
-        # 3. Synchronized the vector index block
-        logging.info("try to write the vector index block ... ")
-        self.dst_handle.seek(Header_Info_Length, 0)
-        for i in range(0, len(self.vector_index)):
-            for j in range(0, len(self.vector_index[i])):
-                vi = self.vector_index[i][j]
-                self.dst_handle.write(vi.encode())
+            # 3. Synchronized the vector index block
+            logging.info("try to write the vector index block ... ")
+            vi = self.vector_index
+            if sys.byteorder != "little":
+                vi = array.array("I", vi)
+                vi.byteswap()
+            mm[Header_Info_Length:data_base] = vi.tobytes()
 
-        # 4. Synchronized the segment index info
-        logging.info("try to write the segment index ptr ... ")
-        buff = struct.pack("<II", start_index_ptr, end_index_ptr)
-        self.dst_handle.seek(8, 0)
-        self.dst_handle.write(buff)
+            # 4. Synchronized the segment index info
+            logging.info("try to write the segment index ptr ... ")
+            _PTR.pack_into(mm, 8, start_index_ptr, end_index_ptr)
+            mm.flush()
 
         logging.info(
             "write done, dataBlocks: {}, indexBlocks: ({}, {}), indexPtr: ({}, {})".format(
@@ -300,17 +345,16 @@ def new_maker(policy: int, srcfile: str, dstfile: str) -> Maker:
     """
     try:
         sh = open(srcfile, mode="r", encoding="utf-8")
-        dh = open(dstfile, mode="wb")
+        dh = open(dstfile, mode="w+b")
         return Maker(
             sh=sh,
             dh=dh,
             ip=policy,
             sg=[],
             rp={},
-            vi=[
-                [idx.VectorIndexBlock() for _ in range(Vector_Index_Rows)]
-                for _ in range(Vector_Index_Cols)
-            ],
+            # A flat (first ptr, last ptr) uint32 pair for each of the
+            # Vector_Index_Rows x Vector_Index_Cols blocks
+            vi=array.array("I", [0]) * (Vector_Index_Rows * Vector_Index_Cols * 2),
         )
     except IOError as e:
         logging.error(e)
@@ -5,6 +5,8 @@
 # Author: linyufeng <leolin49@foxmail.com>
 # Date  : 2022/7/14 17:00
 #
+import socket
+
 _SHIFT_INDEX = (24, 16, 8, 0)
 
 
@@ -13,6 +15,13 @@ def check_ip(ip: str) -> int:
     Convert ip string to integer.
     Return -1 if ip is not the correct ipv4 address.
     """
+    # Fast path: `socket.inet_pton` validates the dotted-quad form in C,
+    # it only rejects the leading zero octets (eg: `001.0.0.0`) which are
+    # still accepted by the slow path below.
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except (OSError, ValueError):
+        pass
     if not is_ipv4(ip):
         return -1
     ps = ip.split(".")
@@ -5,50 +5,46 @@
 " Autho: koma<komazhang@foxmail.com>
 " Date : 2018-10-04
 """
-import threading
-import time, sys
+import multiprocessing
+import os, time, sys
 
 from ip2Region import Ip2Region
 
-class BenchmarkThread(threading.Thread):
-    __searcher = None
-    __lock = None
-
-    def __init__(self, searcher, lock):
-        self.__searcher = searcher
-        self.__lock = lock
-        threading.Thread.__init__(self)
-
-    def run(self):
-        self.__lock.acquire()
-        try:
-            sTime = time.time() * 1000
-            data = self.__searcher.memorySearch("49.220.138.233")
-            eTime = time.time() * 1000
-            # @Note uncomment the print to make it more like the product environment
-            print("%s|%s in %5f millseconds" % (data["city_id"], data["region"].decode('utf-8'), eTime - sTime))
-        finally:
-            self.__lock.release()
+# Searcher of the current worker process, memorySearch reads the region data
+# through the shared db file handle so every worker owns its own searcher
+searcher = None
+
+def initWorker(dbFile):
+    global searcher
+    searcher = Ip2Region(dbFile)
+
+def benchmarkSearch(ip, count):
+    for i in range(count):
+        sTime = time.perf_counter_ns()
+        data = searcher.memorySearch(ip)
+        eTime = time.perf_counter_ns()
+        # @Note uncomment the print to make it more like the product environment
+        print("%s|%s in %5f millseconds" % (data["city_id"], data["region"].decode('utf-8'), (eTime - sTime) / 1e6))
 
 if __name__ == "__main__":
     dbFile = "./data/ip2region.db"
     if ( len(sys.argv) > 2 ):
         dbFile = sys.argv[1];
 
-    threads = []
-    searcher = Ip2Region(dbFile)
-    lock = threading.Lock()
-
-    for i in range(10000):
-        t = BenchmarkThread(searcher, lock)
-        threads.append(t)
+    # Open the db once here so a bad path fails fast instead of inside
+    # every pool worker, then the workers open their own searchers
+    Ip2Region(dbFile).close()
 
-    sTime = time.time() * 1000
-    for t in threads:
-        t.start()
+    # One worker per cpu, each one runs its share of the searches in a loop
+    total = 10000
+    workers = os.cpu_count() or 1
+    counts = [total // workers + (1 if i < total % workers else 0) for i in range(workers)]
+    pool = multiprocessing.Pool(workers, initializer=initWorker, initargs=(dbFile,))
 
-    for t in threads:
-        t.join()
-    eTime = time.time() * 1000
+    sTime = time.perf_counter_ns()
+    pool.starmap(benchmarkSearch, [("49.220.138.233", c) for c in counts])
+    pool.close()
+    pool.join()
+    eTime = time.perf_counter_ns()
 
-    print("Benchmark done: %5f" % (eTime - sTime))
+    print("Benchmark done: %5f" % ((eTime - sTime) / 1e6))